@@ -0,0 +1,103 @@
+import multiprocessing
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from option import *
+from world_generating import WorldGenerator
+
+
+class ChunkArena:
+    """
+    共享内存里的区块数据池
+    整块共享内存按CHUNK_SIZE * CHUNK_SIZE字节分成固定大小的槽位，一个槽位放一个区块的方块id。
+    工作进程直接把生成的方块写进槽位，主进程把槽位的numpy视图当作区块的blocks数组，不用复制也不用反序列化。
+    槽位只由创建它的主进程分配和回收。
+    """
+
+    SLOT_SIZE = CHUNK_SIZE * CHUNK_SIZE
+
+    def __init__(self, slots=CHUNK_ARENA_SLOTS, name=None):
+        self.slots = slots
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=slots * self.SLOT_SIZE)
+        self._array = np.ndarray((slots, CHUNK_SIZE, CHUNK_SIZE), dtype=np.int8, buffer=self.shm.buf)
+        self._free = list(range(slots - 1, -1, -1)) if self.owner else []
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.shm.name}, used={self.slots - len(self._free)}/{self.slots})"
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot) -> np.ndarray:
+        """槽位的区块数组视图，和共享内存共用数据"""
+        return self._array[slot]
+
+    def allocate(self):
+        """分配一个空闲槽位，用完了返回None"""
+        return self._free.pop() if self._free else None
+
+    def release(self, slot):
+        self._free.append(slot)
+
+    def close(self):
+        # 先放掉视图，共享内存才能关闭
+        del self._array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# 工作进程里的全局状态，由_initWorker初始化
+_workerArena = None
+_workerGenerator = None
+_workerChunk = None
+
+
+def _initWorker(seed, arenaName, slots):
+    global _workerArena, _workerGenerator, _workerChunk
+    from base import Chunk
+
+    _workerArena = ChunkArena(slots, name=arenaName)
+    _workerGenerator = WorldGenerator(seed)
+    _workerChunk = Chunk
+
+
+def _generateChunk(slot, x, y):
+    chunk = _workerChunk(x, y, blocks=_workerArena.view(slot))
+    chunk.fillBlocksWith(BlockID.air)
+    _workerGenerator.generateChunk(chunk)
+    return slot
+
+
+def _pygameLoaded():
+    return "pygame" in sys.modules
+
+
+class ChunkWorkers:
+    """在工作进程里把区块直接生成到共享内存槽位里"""
+
+    def __init__(self, seed, arena: ChunkArena, processes=CHUNK_WORKERS):
+        # 用spawn启动，工作进程会重新导入主进程的__main__脚本，所以入口脚本的模块级别不能导入pygame，
+        # 见main.py，可以用import_budget.py检查
+        self._pool = multiprocessing.get_context("spawn").Pool(
+            processes, initializer=_initWorker, initargs=(seed, arena.name, arena.slots))
+
+    def submit(self, slot, x, y):
+        """异步生成，返回AsyncResult，完成后区块数据就在槽位里"""
+        return self._pool.apply_async(_generateChunk, (slot, x, y))
+
+    def generate(self, requests):
+        """并行生成一批区块并等待完成，requests的每项为(槽位, x, y)"""
+        return self._pool.starmap(_generateChunk, requests)
+
+    def pygameLoaded(self) -> bool:
+        """工作进程里是否导入了pygame"""
+        return self._pool.apply(_pygameLoaded)
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
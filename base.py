@@ -1,13 +1,15 @@
 import collections
 import os
 import json
-import multiprocessing
 import struct
 import time
 
-import pygame
+import numpy as np
 
 from option import *
+from arena import ChunkArena, ChunkWorkers
+from lighting import Lighting
+from simulation import Simulation
 from world_generating import WorldGenerator
 
 
@@ -38,6 +40,9 @@ class Block:
 
     @classmethod
     def initBlockTextureMap(cls):
+        # 只有需要渲染时才导入pygame，世界、生成和存储部分不依赖它
+        import pygame
+
         for textureName, i in (k for k in BlockID.__dict__.items() if not k[0].startswith("_")):
             tPath = (os.getcwd() + "\\assets\\textures\\" + textureName + ".png")
             # print(textureName, i)
@@ -50,10 +55,16 @@ class Block:
 
 
 class Chunk:
-    def __init__(self, x: int = None, y: int = None, fillBlock=None):
+    def __init__(self, x: int = None, y: int = None, fillBlock=None, blocks=None):
         self.x = x
         self.y = y
-        self.blocks = None
+        # 方块id数组，blocks[i][j]是区块内第i列、第j行（从下往上数）的方块
+        # 可以传入已有的数组，比如共享内存里的槽位
+        self.blocks = blocks
+        # 数据所在的共享内存槽位，不在共享内存里时为None
+        self.slot = None
+        # 自上次存盘以来是否被修改过，卸载时只有脏区块需要写回磁盘
+        self.dirty = False
         if fillBlock is not None:
             self.fillBlocksWith(fillBlock)
 
@@ -64,39 +75,116 @@ class Chunk:
         return self.blocks[item]
 
     def fillBlocksWith(self, bt=None):
-        self.blocks = [
-            [Block(self.x * CHUNK_SIZE + i, self.y * CHUNK_SIZE + j, blockType=bt)
-             for j in range(CHUNK_SIZE)]
-            for i in range(CHUNK_SIZE)]
+        if bt is None:
+            bt = BlockID.air
+        if self.blocks is None:
+            self.blocks = np.full((CHUNK_SIZE, CHUNK_SIZE), bt, dtype=np.int8)
+        else:
+            # 已经有数组时原地填充，数据仍然留在原来的内存里
+            self.blocks[...] = bt
 
     def dump(self, path):
+        # 文件格式与逐方块写入时相同：两个int坐标，然后按列依次是每个方块的id
         with open(path, "wb") as f:
             f.write(struct.pack("i", self.x))
             f.write(struct.pack("i", self.y))
-            for line in self:
-                for block in line:
-                    f.write(struct.pack("b", block.blockType))
+            f.write(self.blocks.tobytes())
+        self.dirty = False
         # print(f"{self} 已经卸载至磁盘。")
 
     @classmethod
-    def load(cls, path):
+    def load(cls, path, blocks=None):
+        """从文件加载区块，给了blocks时直接读进这个数组"""
         with open(path, "rb") as f:
             newChunk = cls()
             x = struct.unpack("i", f.read(4))[0]
             newChunk.x = x
             y = struct.unpack("i", f.read(4))[0]
             newChunk.y = y
-            newChunk.fillBlocksWith(BlockID.air)
-            for i in range(CHUNK_SIZE):
-                for j in range(CHUNK_SIZE):
-                    bt = struct.unpack("b", f.read(1))[0]
-                    newChunk[i][j] = Block(x * CHUNK_SIZE + i, y * CHUNK_SIZE + j, blockType=bt)
+            newChunk.blocks = np.empty((CHUNK_SIZE, CHUNK_SIZE), dtype=np.int8) if blocks is None else blocks
+            f.readinto(newChunk.blocks)
         # print(f"{newChunk} 已经从磁盘中加载。")
         return newChunk
 
 
+class EditTransaction:
+    """
+    批量修改方块的事务
+    修改先按区块分组记在暂存数组里，提交时每个区块只整体写入一次，
+    受影响的区块只标脏、只通知一次。涉及未加载区块时抛出ChunkError，整个事务不生效。
+    """
+
+    # 暂存数组中表示“不修改”的值
+    _KEEP = -1
+
+    def __init__(self, world):
+        self.world = world
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.commit()
+        else:
+            self._pending.clear()
+
+    def _getPending(self, cx, cy):
+        try:
+            return self._pending[(cx, cy)]
+        except KeyError:
+            if (cx, cy) not in self.world.loadedChunks:
+                raise ChunkError(f"Chunk at ({cx}, {cy}) hasn't loaded!")
+            pending = self._pending[(cx, cy)] = np.full((CHUNK_SIZE, CHUNK_SIZE), self._KEEP, dtype=np.int8)
+            return pending
+
+    def setBlock(self, x, y, blockType):
+        self._getPending(x // CHUNK_SIZE, y // CHUNK_SIZE)[x % CHUNK_SIZE, y % CHUNK_SIZE] = blockType
+        return self
+
+    def fillRect(self, x0, y0, x1, y1, blockType):
+        """填充左下角为(x0, y0)、右上角为(x1, y1)的矩形（包含边界）"""
+        for cx in range(x0 // CHUNK_SIZE, x1 // CHUNK_SIZE + 1):
+            for cy in range(y0 // CHUNK_SIZE, y1 // CHUNK_SIZE + 1):
+                i0 = max(x0 - cx * CHUNK_SIZE, 0)
+                i1 = min(x1 - cx * CHUNK_SIZE, CHUNK_SIZE - 1) + 1
+                j0 = max(y0 - cy * CHUNK_SIZE, 0)
+                j1 = min(y1 - cy * CHUNK_SIZE, CHUNK_SIZE - 1) + 1
+                self._getPending(cx, cy)[i0:i1, j0:j1] = blockType
+        return self
+
+    def fillCircle(self, x, y, radius, blockType):
+        """填充以(x, y)为圆心的圆，比如爆炸"""
+        r = int(radius)
+        for cx in range((x - r) // CHUNK_SIZE, (x + r) // CHUNK_SIZE + 1):
+            for cy in range((y - r) // CHUNK_SIZE, (y + r) // CHUNK_SIZE + 1):
+                dx = np.arange(cx * CHUNK_SIZE, (cx + 1) * CHUNK_SIZE) - x
+                dy = np.arange(cy * CHUNK_SIZE, (cy + 1) * CHUNK_SIZE) - y
+                mask = dx[:, None] ** 2 + dy[None, :] ** 2 <= radius ** 2
+                if mask.any():
+                    self._getPending(cx, cy)[mask] = blockType
+        return self
+
+    def commit(self) -> set:
+        """把暂存的修改写入区块，返回真正发生变化的区块坐标"""
+        changed = set()
+        for pos, pending in self._pending.items():
+            chunk = self.world.loadedChunks[pos]
+            mask = (pending != self._KEEP) & (pending != chunk.blocks)
+            if not mask.any():
+                continue
+            chunk.blocks[mask] = pending[mask]
+            chunk.dirty = True
+            changed.add(pos)
+        self._pending.clear()
+        if changed:
+            self.world.onChunksChanged(changed)
+        return changed
+
+
 class World:
-    def __init__(self, seed: int = DEFAULT_SEED, name: str = "New_World"):
+    def __init__(self, seed: int = DEFAULT_SEED, name: str = "New_World", workers: int = 0):
         self.seed = seed
         self.name = name
 
@@ -106,21 +194,245 @@ class World:
         self.worldGenerator = WorldGenerator(seed=seed)
         self.worldLoadCenterOld = [0, 0]
         self.worldLoadCenterNew = [0, 0]
+        # 按相机速度提前准备好、但还没进入加载范围的区块
+        self.prefetchedChunks = {}
+        # 区块生成、加载、卸载、预取的累计次数，用于性能统计
+        self.chunkStats = collections.Counter()
+        # 区块内容变化时的回调，参数为变化的区块坐标集合，比如渲染缓存
+        self.chunkListeners = []
+        # 区块光照变化时的回调，参数为光照变化的区块坐标集合
+        self.lightListeners = []
+        # 沙子、水的模拟
+        self.simulation = Simulation(self)
+        # 天光
+        self.lighting = Lighting(self)
+
+        # 多进程生成区块，workers为0时都在主进程里生成
+        self.arena = None
+        self.workers = None
+        # 交给工作进程生成、还没收回的预取区块，{坐标: (槽位, AsyncResult)}
+        self._pendingChunks = {}
+        # 预测错了、但工作进程可能还在写的槽位
+        self._orphanedSlots = []
+        if workers:
+            self.arena = ChunkArena()
+            self.workers = ChunkWorkers(seed, self.arena, workers)
 
         self.savePath = os.getcwd() + f"/saves/{name}/"
         if not os.path.exists(self.savePath):
-            os.mkdir(self.savePath)
+            os.makedirs(self.savePath)
 
     def __repr__(self):
         return f"World: \"{self.name}\" on seed \"{self.seed}\""
 
-    def getBlock(self, x, y) -> Block:
+    def close(self):
+        """关闭工作进程并释放共享内存，还在内存里的区块改用私有的数组，之后仍然可以读写、存盘"""
+        if self.workers is not None:
+            self.workers.close()
+            self.workers = None
+        if self.arena is None:
+            return
+        for chunk in (*self.loadedChunks.values(), *self.prefetchedChunks.values()):
+            if chunk.slot is not None:
+                chunk.blocks = chunk.blocks.copy()
+                chunk.slot = None
+        self.prefetchedChunks.clear()
+        self._pendingChunks.clear()
+        self._orphanedSlots.clear()
+        self.arena.close()
+        self.arena = None
+
+    def getChunk(self, x, y) -> Chunk:
+        """按方块坐标找到所在的区块"""
         try:
-            return self.loadedChunks[(x // CHUNK_SIZE, y // CHUNK_SIZE)][x % CHUNK_SIZE][y % CHUNK_SIZE]
+            return self.loadedChunks[(x // CHUNK_SIZE, y // CHUNK_SIZE)]
         except KeyError:
             raise ChunkError(f"Chunk at ({x // CHUNK_SIZE}, {y // CHUNK_SIZE}) hasn't loaded!")
-        except TypeError:
-            raise ChunkError(f"Chunk at ({x // CHUNK_SIZE}, {y // CHUNK_SIZE}) hasn't initialized!")
+
+    def getBlockType(self, x, y) -> int:
+        return int(self.getChunk(x, y).blocks[x % CHUNK_SIZE, y % CHUNK_SIZE])
+
+    def getBlock(self, x, y) -> Block:
+        """返回方块的一份快照，修改它不会影响世界，修改方块请用setBlock或edit"""
+        return Block(x, y, blockType=self.getBlockType(x, y))
+
+    def setBlock(self, x, y, blockType):
+        with self.edit() as t:
+            t.setBlock(x, y, blockType)
+
+    def edit(self) -> EditTransaction:
+        """
+        开始一次批量修改，在with语句结束时提交：
+            with world.edit() as t:
+                t.fillCircle(x, y, 5, BlockID.air)
+        """
+        return EditTransaction(self)
+
+    def addChunkListener(self, callback):
+        self.chunkListeners.append(callback)
+
+    def addLightListener(self, callback):
+        self.lightListeners.append(callback)
+
+    def onChunksChanged(self, positions):
+        for callback in self.chunkListeners:
+            callback(positions)
+        # 方块变了，从这些区块开始往下重算天光
+        self.onLightChanged(self.lighting.update(positions))
+
+    def onLightChanged(self, positions):
+        if not positions:
+            return
+        for callback in self.lightListeners:
+            callback(positions)
+
+    def _allocateSlot(self):
+        return self.arena.allocate() if self.arena is not None else None
+
+    def _slotView(self, slot):
+        return None if slot is None else self.arena.view(slot)
+
+    def _releaseSlot(self, slot):
+        if slot is not None:
+            self.arena.release(slot)
+
+    def _adoptSlot(self, x, y, slot) -> Chunk:
+        """接收工作进程生成在共享内存槽位里的区块，直接用槽位当区块数组，不复制数据"""
+        chunk = Chunk(x, y, blocks=self.arena.view(slot))
+        chunk.slot = slot
+        chunk.dirty = True
+        return chunk
+
+    def _loadChunk(self, x, y):
+        """从磁盘加载区块，还没生成过时返回None"""
+        slot = self._allocateSlot()
+        try:
+            chunk = Chunk.load(self.savePath + f"Chunk({x}, {y}).bin", blocks=self._slotView(slot))
+        except FileNotFoundError:
+            self._releaseSlot(slot)
+            return None
+        chunk.slot = slot
+        self.chunkStats["loaded"] += 1
+        return chunk
+
+    def _generateChunk(self, x, y) -> Chunk:
+        """在主进程里生成区块"""
+        slot = self._allocateSlot()
+        chunk = Chunk(x, y, fillBlock=BlockID.air, blocks=self._slotView(slot))
+        chunk.slot = slot
+        self.worldGenerator.generateChunk(chunk)
+        chunk.dirty = True
+        # print(f"{chunk} 已经被动态生成。")
+        return chunk
+
+    def _acquireChunks(self, positions) -> list:
+        """
+        按顺序取得这些区块：优先用预取好的，其次从磁盘加载，都没有才生成，有工作进程时并行生成
+        生成的区块在这里、也就是进入加载范围时才计数，这样不管在哪里生成、什么时候生成完，每帧的计数都一样
+        """
+        chunks = {}
+        toGenerate = []
+        for pos in positions:
+            chunk = self.prefetchedChunks.pop(pos, None)
+            if chunk is None and pos in self._pendingChunks:
+                # 工作进程还在生成，等它写完
+                slot, result = self._pendingChunks.pop(pos)
+                result.get()
+                chunk = self._adoptSlot(*pos, slot)
+            if chunk is not None:
+                self.chunkStats["prefetchHit"] += 1
+                chunks[pos] = chunk
+                continue
+            chunk = self._loadChunk(*pos)
+            if chunk is None:
+                toGenerate.append(pos)
+            else:
+                chunks[pos] = chunk
+
+        if self.workers is not None:
+            requests = []
+            for x, y in toGenerate:
+                slot = self.arena.allocate()
+                if slot is None:
+                    # 槽位用完了，剩下的在主进程里生成
+                    break
+                requests.append((slot, x, y))
+            self.workers.generate(requests)
+            for slot, x, y in requests:
+                chunks[(x, y)] = self._adoptSlot(x, y, slot)
+        for pos in toGenerate:
+            if pos not in chunks:
+                chunks[pos] = self._generateChunk(*pos)
+        # 刚生成的区块是dirty的，从磁盘加载的不是，预取的区块在进入加载范围前不会被修改
+        self.chunkStats["generated"] += sum(chunk.dirty for chunk in chunks.values())
+        return [chunks[pos] for pos in positions]
+
+    def _collectPendingChunks(self):
+        """把工作进程已经生成好的预取区块收进来，回收预测错了的区块写完后的槽位"""
+        for pos, (slot, result) in list(self._pendingChunks.items()):
+            if result.ready():
+                result.get()
+                del self._pendingChunks[pos]
+                self.prefetchedChunks[pos] = self._adoptSlot(*pos, slot)
+        orphaned = []
+        for slot, result in self._orphanedSlots:
+            if result.ready():
+                self.arena.release(slot)
+            else:
+                orphaned.append((slot, result))
+        self._orphanedSlots = orphaned
+
+    def prefetchChunks(self, cx, cy):
+        """
+        相机预计会把加载中心带到(cx, cy)，提前准备那时需要、现在还没加载的区块，每次最多PREFETCH_BUDGET个
+        预取的区块在真正进入加载范围前不会被修改，预测错了直接丢掉就行，不用写回磁盘
+        有工作进程时预取的区块交给它们异步生成，主进程不等待
+        """
+        center = self.worldLoadCenterNew
+
+        def unwanted(p):
+            return (max(abs(p[0] - cx), abs(p[1] - cy)) > LOAD_RANGE
+                    and max(abs(p[0] - center[0]), abs(p[1] - center[1])) > LOAD_RANGE)
+
+        self._collectPendingChunks()
+        for pos in [p for p in self.prefetchedChunks if unwanted(p)]:
+            chunk = self.prefetchedChunks.pop(pos)
+            self._releaseSlot(chunk.slot)
+            self.chunkStats["prefetchMiss"] += 1
+            # 白白生成了的区块
+            self.chunkStats["prefetchWasted"] += chunk.dirty
+        for pos in [p for p in self._pendingChunks if unwanted(p)]:
+            # 工作进程可能还在写这个槽位，写完才能回收
+            self._orphanedSlots.append(self._pendingChunks.pop(pos))
+            self.chunkStats["prefetchMiss"] += 1
+            self.chunkStats["prefetchWasted"] += 1
+
+        if [cx, cy] == center:
+            return
+        candidates = [(x, y)
+                      for y in range(cy - LOAD_RANGE, cy + LOAD_RANGE + 1)
+                      for x in range(cx - LOAD_RANGE, cx + LOAD_RANGE + 1)
+                      if (x, y) not in self.loadedChunks and (x, y) not in self.prefetchedChunks
+                      and (x, y) not in self._pendingChunks]
+        # 离当前加载中心越近的越早用得上
+        candidates.sort(key=lambda p: max(abs(p[0] - center[0]), abs(p[1] - center[1])))
+        for x, y in candidates[:PREFETCH_BUDGET]:
+            self.chunkStats["prefetched"] += 1
+            chunk = self._loadChunk(x, y)
+            if chunk is None and self.workers is not None:
+                slot = self.arena.allocate()
+                if slot is not None:
+                    self._pendingChunks[(x, y)] = (slot, self.workers.submit(slot, x, y))
+                    continue
+            if chunk is None:
+                chunk = self._generateChunk(x, y)
+            self.prefetchedChunks[(x, y)] = chunk
+
+    @property
+    def prefetchHitRate(self):
+        """已有结果的预取区块里被用上的比例，还没有结果时为None"""
+        resolved = self.chunkStats["prefetchHit"] + self.chunkStats["prefetchMiss"]
+        return self.chunkStats["prefetchHit"] / resolved if resolved else None
 
     def updateLoadedChunks(self, forced=False):
         if self.worldLoadCenterNew == self.worldLoadCenterOld and not forced:
@@ -128,28 +440,38 @@ class World:
             return
 
         checkChunksSet = set()
+        newChunks = []
         for y in range(self.worldLoadCenterNew[1] - LOAD_RANGE, self.worldLoadCenterNew[1] + LOAD_RANGE + 1):
             for x in range(self.worldLoadCenterNew[0] - LOAD_RANGE, self.worldLoadCenterNew[0] + LOAD_RANGE + 1):
                 checkChunksSet.add((x, y))
                 if (x, y) in self.loadedChunks:
                     # 这个区块已经在加载中了
                     continue
-                try:
-                    chunk = Chunk.load(self.savePath + f"Chunk({x}, {y}).bin")
-                except FileNotFoundError:
-                    # 区块还没有生成
-                    chunk = Chunk(x, y, fillBlock=BlockID.air)
-                    self.worldGenerator.generateChunk(chunk)
-                    # print(f"{chunk} 已经被动态生成。")
-                self.totalChunks.add((x, y))
-                self.loadedChunks[(x, y)] = chunk
+                newChunks.append((x, y))
+        for pos, chunk in zip(newChunks, self._acquireChunks(newChunks)):
+            self.totalChunks.add(pos)
+            self.loadedChunks[pos] = chunk
 
+        self.simulation.wake(newChunks)
+
+        unloaded = []
         for y in range(self.worldLoadCenterOld[1] - LOAD_RANGE, self.worldLoadCenterOld[1] + LOAD_RANGE + 1):
             for x in range(self.worldLoadCenterOld[0] - LOAD_RANGE, self.worldLoadCenterOld[0] + LOAD_RANGE + 1):
                 if (x, y) not in checkChunksSet:
                     if (x, y) in self.loadedChunks:
-                        self.loadedChunks[(x, y)].dump(self.savePath + f"Chunk({x}, {y}).bin")
-                        del self.loadedChunks[(x, y)]
+                        chunk = self.loadedChunks.pop((x, y))
+                        self.lighting.discard((x, y))
+                        unloaded.append((x, y))
+                        # 没有改动过的区块磁盘上已有一样的数据，不用再写
+                        if chunk.dirty:
+                            chunk.dump(self.savePath + f"Chunk({x}, {y}).bin")
+                            self.chunkStats["dumped"] += 1
+                        self._releaseSlot(chunk.slot)
+
+        # 新加载的区块算出天光，它们下方已加载的区块也可能因此变化；
+        # 上方区块被卸载的区块改按未加载的规则重算，保证光照只取决于当前加载的方块
+        exposed = [(x, y - 1) for x, y in unloaded if (x, y - 1) in self.loadedChunks]
+        self.onLightChanged(self.lighting.update(newChunks + exposed))
 
         self.worldLoadCenterOld = self.worldLoadCenterNew[:]
 
@@ -170,41 +492,6 @@ class World:
         return newWorld
 
 
-class PromptBar:
-    def __init__(self, font: pygame.font.Font, dest: pygame.Surface, maxLen, position=(0, 0), fadeTime=300):
-        from collections import deque
-        self._prompts = deque(maxlen=maxLen)
-        self._font = font
-        self._dest = dest
-        self._defaultFadeTime = fadeTime
-        self._x, self._y = position  # 左下角坐标
-
-    def push(self, text, debug=False, *args, **kwargs):
-        if not args:
-            c = pygame.Color(0, 0, 0, 0)
-            c.hsva = (12 * (round(time.time()) % 30), 100, 100, 100)
-            args = (True, c)
-        if debug:
-            text = f"[{time.strftime('%H:%M:%S')}][调试信息] " + text
-        textSurface = self._font.render(text, *args, **kwargs)
-        self._prompts.appendleft([textSurface, self._defaultFadeTime])
-
-    def biltMe(self):
-        for i, (ts, ft) in enumerate(list(self._prompts)[:]):
-            tsr = ts.get_rect()
-            h = tsr.height
-            tsr.topleft = (self._x, self._y - (i + 1) * h)
-            ts.set_alpha(255 * (ft / self._defaultFadeTime))
-            self._dest.blit(ts, tsr)
-            if ft == 1:
-                try:
-                    del self._prompts[i]
-                except IndexError:
-                    pass
-                continue
-            self._prompts[i][1] -= 1
-
-
 if __name__ == '__main__':
     a = 0
     for _ in range(10):
@@ -149,7 +149,9 @@ class PerlinNoise2D(Noise):
             if len(self._cache) >= 384:
                 self._cache.popitem()
             if v not in self._cache:
-                random.seed(v.getTuple())
+                # Python 3.11起random.seed不再接受元组。旧版本以哈希值转成无符号64位整数作种子，
+                # 而random.seed(int)取的是绝对值，负的哈希值要先转成无符号的才能生成一样的地形
+                random.seed(hash(v.getTuple()) & 0xFFFFFFFFFFFFFFFF)
                 deg = random.uniform(0, 360)
                 self._cache[v] = Vector2D(math.cos(deg), math.sin(deg))
             return self._cache[v]
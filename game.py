@@ -0,0 +1,429 @@
+import multiprocessing
+import os
+import random
+import sys
+import bisect
+import threading
+import time
+
+import numpy as np
+import pygame.mixer
+
+from option import *
+from base import Block, World
+from base2 import Vector2D
+from gui import PromptBar
+from world_generating import WORLD_LAYER_EDGE, WORLD_LAYER_BGM, WORLD_LAYER_BACKGROUND, WORLD_LAYER_NAME
+from replay import InputRecord, ReplayReport, getScenario, SCENARIOS, defaultRecordPath
+
+
+class Main:
+    """负责交互,音效和渲染的类"""
+
+    def __init__(self, window_: pygame.Surface, world=None):
+        self.window = window_
+        if not world:
+            self.world = World(workers=CHUNK_WORKERS)
+        else:
+            self.world = world
+
+        self.clock = pygame.time.Clock()
+        self.running = True
+        self.fps = 0
+
+        # 渲染部分
+        self.screenCenterPosition = Vector2D(0, 0)
+        self.screenCenterVelocity = Vector2D(0, 0)
+        self.scale = 1.00
+        self.centerPosition = Vector2D(WINDOW_WIDTH // 2, -WINDOW_HEIGHT // 2)
+        self.backGroundDict = dict()
+        self.backGroundRect = pygame.Rect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+        # 区块图像缓存
+        self.chunkSurfaceCache = {}
+        self.blockTextures = {i: pygame.transform.scale(t, (BLOCK_SIZE, BLOCK_SIZE))
+                              for i, t in Block.blockTextureMap.items()}
+        self.world.addChunkListener(self._onChunksChanged)
+        self.world.addLightListener(self._onChunksChanged)
+
+        # 音频部分
+        self.volume = 0.25
+        pygame.mixer.music.set_volume(self.volume)
+
+        # 字体部分
+        self.aaHhhFont16 = pygame.font.Font("./assets/fonts/Aa嘿嘿黑.ttf", 16)  # 宋体
+        self.aahhhFont64 = pygame.font.Font("./assets/fonts/Aa嘿嘿黑.ttf", 64)
+
+        # gui界面
+        self.showInfo = False
+        self.gui = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), flags=pygame.SRCALPHA)
+        self.promptBar = PromptBar(font=self.aaHhhFont16, dest=self.window, maxLen=20, position=(0, WINDOW_HEIGHT),
+                                   fadeTime=180)
+        self.promptBar.push(
+            f"[{time.strftime('%H:%M:%S')}][调试信息] 初始化已完成")
+
+        # 其他变量
+        # 区域提示计时器
+        self.layerTipTimer = LAYER_TIP_DISPLAY_TIME
+        # 区域名称
+        # self.worldLayer = bisect.bisect(WORLD_LAYER_EDGE, self.screenCenterPosition.y)
+        self.worldLayer = 0
+        # 按键录制，为None时不录制
+        self.inputRecord = None
+
+    def run(self):
+        while self.running:
+            self.fps = self.clock.get_fps()
+
+            self._updateFrame()
+            self._renderFrame()
+            self._checkEvents()
+
+            # 限制最高帧率
+            self.clock.tick(MAX_FPS)
+
+        self.world.close()
+        pygame.quit()
+        sys.exit(0)
+
+        # 多进程尝试
+        # renderProcess = multiprocessing.Process(target=self._renderLoop)
+        # renderProcess.start()
+        # updateProcess = multiprocessing.Process(target=self._updateLoop)
+        # updateProcess.start()
+
+    def replay(self, record: InputRecord, name="") -> ReplayReport:
+        """以固定的种子和固定的时间步长回放一段按键录制，返回每一帧的耗时与区块统计"""
+        # 从开始录制时的相机状态开始，加载中心也跟着相机
+        self.screenCenterPosition = Vector2D(*record.position)
+        self.screenCenterVelocity = Vector2D(*record.velocity)
+        self.scale = record.scale
+        self.world.worldLoadCenterNew[0] = int(self.screenCenterPosition.x // CHUNK_SIZE)
+        self.world.worldLoadCenterNew[1] = int(self.screenCenterPosition.y // CHUNK_SIZE)
+        report = ReplayReport(name)
+        stats = self.world.chunkStats
+        for tick, keyState in enumerate(record):
+            # 固定时间步长，不受实际帧率影响
+            self.fps = MAX_FPS
+            oldStats = stats.copy()
+            t = time.perf_counter()
+
+            if tick == 0:
+                # 加载中心一开始没有变动，updateLoadedChunks不会加载任何区块，初始加载计入第一帧
+                self.world.updateLoadedChunks(forced=True)
+            # 录制时记下按键状态后马上就应用了，之后才更新下一帧，回放时按同样的顺序
+            self._applyPressedKeys(keyState)
+            self._updateFrame()
+            self._renderFrame()
+            pygame.event.pump()
+
+            report.push((time.perf_counter() - t) * 1000,
+                        stats["generated"] - oldStats["generated"],
+                        stats["loaded"] - oldStats["loaded"],
+                        stats["dumped"] - oldStats["dumped"])
+        return report
+
+    def _toggleRecording(self):
+        if self.inputRecord is None:
+            self.inputRecord = InputRecord(seed=self.world.seed,
+                                           position=(self.screenCenterPosition.x, self.screenCenterPosition.y),
+                                           velocity=(self.screenCenterVelocity.x, self.screenCenterVelocity.y),
+                                           scale=self.scale)
+            self.promptBar.push("开始录制按键", debug=True)
+            return
+        path = defaultRecordPath()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.inputRecord.dump(path)
+        self.promptBar.push(f"按键录制已保存至{path}，共{len(self.inputRecord)}帧", debug=True)
+        self.inputRecord = None
+
+    def _renderLoop(self):
+        while self.running:
+            self.fps = self.clock.get_fps()
+
+            self._renderFrame()
+
+            self.clock.tick(MAX_FPS)
+
+    def _updateLoop(self):
+        self.world.updateLoadedChunks(forced=True)
+        while self.running:
+            self._updateFrame()
+        pygame.quit()
+        sys.exit()
+
+    def _checkEvents(self):
+        events = pygame.event.get()
+        for e in events:
+            if e.type == pygame.QUIT:
+                self.running = False
+            if e.type == pygame.KEYDOWN:
+                if e.key == pygame.K_COMMA:
+                    self.volume = max(self.volume - 0.05, 0)
+                    pygame.mixer.music.set_volume(self.volume)
+                    self.promptBar.push(
+                        "音量减小", debug=True
+                    )
+                elif e.key == pygame.K_PERIOD:
+                    self.volume = min(self.volume + 0.05, 1)
+                    pygame.mixer.music.set_volume(self.volume)
+                    self.promptBar.push(
+                        "音量增大", debug=True
+                    )
+                elif e.key == pygame.K_F3:
+                    self.showInfo = not self.showInfo
+                    self.promptBar.push(
+                        f"已{'打开' if self.showInfo else '关闭'}调试信息界面", debug=True
+                    )
+                elif e.key == pygame.K_F5:
+                    self._toggleRecording()
+                else:
+                    pass
+
+        pressedKeys = pygame.key.get_pressed()
+        if self.inputRecord is not None:
+            self.inputRecord.push(pressedKeys)
+        self._applyPressedKeys(pressedKeys)
+
+    def _applyPressedKeys(self, pressedKeys):
+        if pressedKeys[pygame.K_UP]:
+            self.screenCenterVelocity.y += 0.5
+        if pressedKeys[pygame.K_DOWN]:
+            self.screenCenterVelocity.y -= 0.5
+        if pressedKeys[pygame.K_LEFT]:
+            self.screenCenterVelocity.x -= 0.5
+        if pressedKeys[pygame.K_RIGHT]:
+            self.screenCenterVelocity.x += 0.5
+        if pressedKeys[pygame.K_SPACE]:
+            self.screenCenterVelocity.x = 0.0
+            self.screenCenterVelocity.y = 0.0
+        if pressedKeys[pygame.K_LSHIFT]:
+            self.screenCenterVelocity *= 0.5
+        if pressedKeys[pygame.K_MINUS]:
+            self.scale = max(self.scale - 0.05, 0.2)
+        if pressedKeys[pygame.K_EQUALS]:
+            self.scale = min(self.scale + 0.05, 5)
+
+    def _renderFrame(self):
+        # 清屏
+        try:
+            self.window.blit(self.backGroundDict[self.worldLayer], self.backGroundRect)
+        except KeyError:
+            pass
+        self.gui.fill(color=(0, 0, 0, 0))
+        # 渲染方块
+        self._renderBlocks()
+        # gui界面
+        self._renderGUI()
+        # 渲染提示栏
+        self.promptBar.biltMe()
+        # 刷新屏幕
+        pygame.display.flip()
+
+    def _renderGUI(self):
+        # 屏幕中间炫酷吊炸天的提示！！！
+        if self.worldLayer != bisect.bisect(WORLD_LAYER_EDGE, self.screenCenterPosition.y):
+            self.layerTipTimer = LAYER_TIP_DISPLAY_TIME
+        if self.layerTipTimer:
+            layerTip = self.aahhhFont64.render(WORLD_LAYER_NAME[self.worldLayer], True, "#99c9fd")
+            layerTipRect = layerTip.get_rect()
+            layerTipRect.center = (WINDOW_WIDTH // 2, WINDOW_HEIGHT // 4)
+            layerTip.set_alpha(self.layerTipTimer * (256 // 120))
+            self.layerTipTimer -= 1
+            self.gui.blit(layerTip, layerTipRect)
+        self.worldLayer = bisect.bisect(WORLD_LAYER_EDGE, self.screenCenterPosition.y)
+
+        if self.showInfo:
+            hitRate = self.world.prefetchHitRate
+            information = (
+                f"当前帧率：{round(self.fps)}\n",
+                f"相机位置：{self.screenCenterPosition.getTuple()}\n",
+                f"相机速度：{self.screenCenterVelocity.getTuple()}\n",
+                f"世界名称：{self.world.name}\n",
+                f"当前加载区块数：{len(self.world.loadedChunks)}\n",
+                f"世界总区块数：{len(self.world.totalChunks)}\n",
+                f"模拟耗时：{self.world.simulation.tickCost:.2f}ms/tick，"
+                f"活跃区块数：{self.world.simulation.lastActiveCount}",
+                f"预取命中率：{'-' if hitRate is None else f'{hitRate:.0%}'}"
+                f"（命中{self.world.chunkStats['prefetchHit']}，丢弃{self.world.chunkStats['prefetchMiss']}，"
+                f"其中白生成{self.world.chunkStats['prefetchWasted']}）",
+                f"当前区域： {WORLD_LAYER_NAME[self.worldLayer]}",
+                f"当前缩放倍率： {round(self.scale, 2)}",
+                f"背景音乐：{WORLD_LAYER_BGM[bisect.bisect(WORLD_LAYER_EDGE, self.screenCenterPosition.y)].split('/')[-1]}",
+                f"当前音量： {round(self.volume * 100)}%"
+            )
+            for i, info in enumerate(information):
+                infoSurface = self.aaHhhFont16.render(info, True, "#ffffff")
+                info2 = infoSurface.copy()
+                info2.fill("#000000")
+                infoRenderRect = infoSurface.get_rect()
+                info2.set_alpha(128)
+                infoRenderRect.topleft = (0, i * infoRenderRect.height)
+                self.gui.blit(info2, infoRenderRect)
+                self.gui.blit(infoSurface, infoRenderRect)
+
+        self.window.blit(self.gui, self.backGroundRect)
+
+    def _renderBlocks(self):
+        widthBlockCount = int(WINDOW_WIDTH // (2 * (BLOCK_SIZE * self.scale)) + 4)
+        heightBlockCount = int(WINDOW_HEIGHT // (2 * (BLOCK_SIZE * self.scale)) + 4)
+
+        # 丢掉已经卸载的区块的缓存
+        for pos in self.chunkSurfaceCache.keys() - self.world.loadedChunks.keys():
+            del self.chunkSurfaceCache[pos]
+
+        yRange = range(round(self.screenCenterPosition.y - heightBlockCount - 2) // CHUNK_SIZE,
+                       round(self.screenCenterPosition.y + heightBlockCount + 2) // CHUNK_SIZE + 1)
+        xRange = range(round(self.screenCenterPosition.x - widthBlockCount - 2) // CHUNK_SIZE,
+                       round(self.screenCenterPosition.x + widthBlockCount + 2) // CHUNK_SIZE + 1)
+        for cy in yRange:
+            for cx in xRange:
+                chunk = self.world.loadedChunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                self._renderChunk(chunk)
+
+    def _renderChunk(self, chunk):
+        entry = self.chunkSurfaceCache.get((chunk.x, chunk.y))
+        if entry is None or entry[0] is not chunk:
+            # [区块, 原尺寸的区块图像, 缩放后的图像, 缩放后图像对应的缩放倍率]
+            entry = self.chunkSurfaceCache[(chunk.x, chunk.y)] = [chunk, self._buildChunkSurface(chunk), None, None]
+        if entry[1] is None:
+            # 整个区块都是空气
+            return
+        if entry[3] != self.scale:
+            size = int(CHUNK_SIZE * BLOCK_SIZE * self.scale) + 1
+            entry[2] = pygame.transform.scale(entry[1], (size, size))
+            entry[3] = self.scale
+
+        # 区块图像的左上角是区块第0列最上面一行的方块
+        blockPos = Vector2D(chunk.x * CHUNK_SIZE, chunk.y * CHUNK_SIZE + CHUNK_SIZE - 1)
+        # 因为上面的计算都是以世界坐标（x轴以右为正方向，y轴以上为正方向）进行运算的，
+        # 而屏幕是以左上角为原点、x以下为正方向、y以右为正方向，所以需要翻转y坐标。
+        displayPos = (
+                (BLOCK_SIZE * (blockPos - self.screenCenterPosition)) * self.scale + self.centerPosition).xMirror()
+        if displayPos.x > WINDOW_WIDTH or displayPos.y > WINDOW_HEIGHT:
+            return
+        displayRect = entry[2].get_rect()
+        displayRect.topleft = displayPos.getTuple()
+
+        self.window.blit(entry[2], displayRect)
+
+    def _buildChunkSurface(self, chunk):
+        """把整个区块画到一张图像上缓存起来，区块内容不变就不用逐个方块地重画"""
+        blocks = chunk.blocks
+        if not blocks.any():
+            return None
+        surface = pygame.Surface((CHUNK_SIZE * BLOCK_SIZE, CHUNK_SIZE * BLOCK_SIZE), flags=pygame.SRCALPHA)
+        textures = self.blockTextures
+        surface.blits(
+            ((textures[blocks[i, j]], (i * BLOCK_SIZE, (CHUNK_SIZE - 1 - j) * BLOCK_SIZE))
+             for i, j in zip(*blocks.nonzero())),
+            doreturn=False
+        )
+
+        # 把天光烘焙进区块图像：每个方块乘上它的亮度，透明的空气不受影响
+        light = self.world.lighting.getLight((chunk.x, chunk.y))
+        if light is not None:
+            brightness = (MIN_BLOCK_BRIGHTNESS + (255 - MIN_BLOCK_BRIGHTNESS) * light.astype(np.uint16) // MAX_LIGHT)
+            # surfarray的第二维是屏幕上从上往下，和区块内的行号相反
+            brightness = np.repeat(brightness[:, ::-1, None], 3, axis=2).astype(np.uint8)
+            shade = pygame.transform.scale(pygame.surfarray.make_surface(brightness), surface.get_size())
+            surface.blit(shade, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+        return surface
+
+    def _onChunksChanged(self, positions):
+        # 只让内容或光照变化了的区块重画
+        for pos in positions:
+            self.chunkSurfaceCache.pop(pos, None)
+
+    def _updateFrame(self):
+        # 更改标题
+        # pygame.display.set_caption(f"{''.join(chr(random.randint(1, 32767)) for _ in range(16))}")
+
+        # 更新相机位置
+        self.screenCenterPosition += self.screenCenterVelocity * (20 / (self.fps + 1))
+        self.screenCenterVelocity *= 0.9
+
+        # 沙子、水的模拟，按固定tick速率运行
+        if self.fps:
+            self.world.simulation.advance(1 / self.fps)
+
+        # 更新加载区块
+        self.world.updateLoadedChunks()
+        self.world.worldLoadCenterNew[0] = int(self.screenCenterPosition.x // CHUNK_SIZE)
+        self.world.worldLoadCenterNew[1] = int(self.screenCenterPosition.y // CHUNK_SIZE)
+        # 按当前速度外推相机路径，提前准备好前方的区块
+        predicted = self.screenCenterPosition + self.screenCenterVelocity * (20 / (self.fps + 1)) * PREFETCH_LOOKAHEAD
+        self.world.prefetchChunks(int(predicted.x // CHUNK_SIZE), int(predicted.y // CHUNK_SIZE))
+
+        # 更新bgm
+        i = bisect.bisect(WORLD_LAYER_EDGE, self.screenCenterPosition.y)
+        if self.worldLayer != i:
+            pygame.mixer.music.unload()
+            try:
+                pygame.mixer.music.load(WORLD_LAYER_BGM[i])
+                pygame.mixer.music.play(-1)
+            except pygame.error:
+                pass
+
+        # 加载背景
+        if self.worldLayer != i:
+            try:
+                backg = pygame.transform.scale(pygame.image.load(WORLD_LAYER_BACKGROUND[i]).convert_alpha(),
+                                               (WINDOW_WIDTH, WINDOW_HEIGHT))
+                self.backGroundDict[i] = backg
+            except FileNotFoundError:
+                backg = pygame.transform.scale(pygame.image.load("./assets/textures/bgs/noBG.png").convert_alpha(),
+                                               (WINDOW_WIDTH, WINDOW_HEIGHT))
+                self.backGroundDict[i] = backg
+
+
+def initDisplay(headless=False) -> pygame.Surface:
+    """
+    初始化pygame、窗口、纹理和声音，返回窗口
+    导入本模块时不会做这些事，需要显式调用
+    headless为True时使用SDL的虚拟驱动，不打开真正的窗口和声卡
+    """
+    if headless:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    # 模块参数初始化
+    pygame.init()
+
+    # 运行前及类初始化
+    window_ = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), flags=pygame.HWSURFACE)
+    Block.initBlockTextureMap()
+    pygame.display.set_icon(Block.blockTextureMap[2])
+
+    # 标题整活
+    pygame.display.set_caption(f"{''.join(chr(random.randint(0, 32767)) for _ in range(16))}")
+    return window_
+
+
+def runReplay(target, out=None, baseline=None, workers=0):
+    """回放录制文件或标准场景，target为"all"时依次回放所有标准场景，workers为生成区块的工作进程数"""
+    import shutil
+
+    window = initDisplay(headless=True)
+    names = SCENARIOS if target == "all" else (target,)
+    for name in names:
+        record = getScenario(name) if name in SCENARIOS else InputRecord.load(name)
+        # 每次回放都从全新的世界开始，保证区块统计可以复现
+        world = World(seed=record.seed, name="Replay", workers=workers)
+        shutil.rmtree(world.savePath)
+        os.makedirs(world.savePath)
+
+        report = Main(window, world=world).replay(record, name=name)
+        world.close()
+        if out:
+            report.dump(out if len(names) == 1 else f"{os.path.splitext(out)[0]}_{name}.csv")
+        print(f"[{name}]")
+        if baseline:
+            base = ReplayReport.load(baseline if len(names) == 1 else
+                                     f"{os.path.splitext(baseline)[0]}_{name}.csv")
+            for k, (old, new) in report.compare(base).items():
+                print(f"\t{k}: {old} -> {new}")
+        else:
+            for k, v in report.summary().items():
+                print(f"\t{k}: {v}")
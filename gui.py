@@ -0,0 +1,38 @@
+import time
+from collections import deque
+
+import pygame
+
+
+class PromptBar:
+    def __init__(self, font: pygame.font.Font, dest: pygame.Surface, maxLen, position=(0, 0), fadeTime=300):
+        self._prompts = deque(maxlen=maxLen)
+        self._font = font
+        self._dest = dest
+        self._defaultFadeTime = fadeTime
+        self._x, self._y = position  # 左下角坐标
+
+    def push(self, text, debug=False, *args, **kwargs):
+        if not args:
+            c = pygame.Color(0, 0, 0, 0)
+            c.hsva = (12 * (round(time.time()) % 30), 100, 100, 100)
+            args = (True, c)
+        if debug:
+            text = f"[{time.strftime('%H:%M:%S')}][调试信息] " + text
+        textSurface = self._font.render(text, *args, **kwargs)
+        self._prompts.appendleft([textSurface, self._defaultFadeTime])
+
+    def biltMe(self):
+        for i, (ts, ft) in enumerate(list(self._prompts)[:]):
+            tsr = ts.get_rect()
+            h = tsr.height
+            tsr.topleft = (self._x, self._y - (i + 1) * h)
+            ts.set_alpha(255 * (ft / self._defaultFadeTime))
+            self._dest.blit(ts, tsr)
+            if ft == 1:
+                try:
+                    del self._prompts[i]
+                except IndexError:
+                    pass
+                continue
+            self._prompts[i][1] -= 1
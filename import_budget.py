@@ -0,0 +1,65 @@
+"""
+测量核心模块的导入耗时，检查它们没有导入pygame
+    python import_budget.py
+超出预算或导入了pygame时以非零状态码退出
+"""
+import subprocess
+import sys
+import time
+
+# 游戏的工作进程以spawn方式启动，会重新导入游戏的入口脚本main.py。这里也在模块级别导入它，
+# 这个脚本启动的工作进程就和游戏里的一样会重新导入main.py，main.py导入了pygame的话检查就会失败
+import main
+from arena import ChunkArena, ChunkWorkers
+from option import IMPORT_TIME_BUDGET, WORKER_START_BUDGET
+
+# 工作进程需要的核心模块：世界模型、地形生成、存储和共享内存，以及会被工作进程重新导入的入口脚本
+CORE_MODULES = ("option", "base2", "world_generating", "base", "arena", "main")
+
+_MEASURE_CODE = """
+import sys, time
+t = time.perf_counter()
+import {module}
+print((time.perf_counter() - t) * 1000, "pygame" in sys.modules)
+"""
+
+
+def measureImport(module, repeat=3):
+    """在全新的解释器里导入模块repeat次，返回(最短耗时ms, 是否导入了pygame)"""
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _MEASURE_CODE.format(module=module)],
+                             capture_output=True, text=True, check=True).stdout.splitlines()[-1].split()
+        # 导入pygame时它会先打印欢迎信息，结果在最后一行
+        results.append((float(out[0]), out[1] == "True"))
+    return min(results)
+
+
+def measureWorkerStart():
+    """像游戏里一样启动一个生成区块的工作进程并等它生成一个区块，返回(耗时ms, 是否导入了pygame)"""
+    arena = ChunkArena(1)
+    t = time.perf_counter()
+    workers = ChunkWorkers(0, arena, 1)
+    try:
+        workers.generate([(0, 0, 0)])
+        ms = (time.perf_counter() - t) * 1000
+        return ms, workers.pygameLoaded()
+    finally:
+        workers.close()
+        arena.close()
+
+
+if __name__ == "__main__":
+    ok = True
+    for m in CORE_MODULES:
+        ms, pygameLoaded = measureImport(m)
+        passed = ms <= IMPORT_TIME_BUDGET and not pygameLoaded
+        ok &= passed
+        print(f"{'通过' if passed else '超标'}\timport {m}: {ms:.2f}ms{'，导入了pygame' if pygameLoaded else ''}")
+
+    ms, pygameLoaded = measureWorkerStart()
+    passed = ms <= WORKER_START_BUDGET and not pygameLoaded
+    ok &= passed
+    print(f"{'通过' if passed else '超标'}\t工作进程启动: {ms:.2f}ms{'，导入了pygame' if pygameLoaded else ''}")
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,81 @@
+import numpy as np
+
+from option import *
+
+# 每种方块让穿过它的天光衰减多少，按方块id索引
+_OPACITY = np.zeros(max(v for k, v in vars(BlockID).items() if not k.startswith("_")) + 1, dtype=np.int16)
+_OPACITY[[BlockID.stone, BlockID.grass, BlockID.dirt, BlockID.sand]] = 4
+_OPACITY[BlockID.water] = 2
+# 云不挡光，否则天域里几十格厚的云会让下面的地表全都不见天日
+_OPACITY[BlockID.cloud] = 0
+
+
+class Lighting:
+    """
+    按区块列自上而下计算的天光
+    每个区块保存一个光照数组，light[i][j]是照到区块内第i列、第j行方块上的天光，0~MAX_LIGHT。
+    一个区块的天光只取决于它上方区块透下来的光和它自己的方块，所以区块加载或方块变化时，
+    只需从这个区块开始往下重算，直到透下去的光不再变化为止。
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.lightMaps = {}
+        # 每个区块从底部透到下方区块的光
+        self._bottomLight = {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(chunks={len(self.lightMaps)})"
+
+    def getLight(self, pos):
+        return self.lightMaps.get(pos)
+
+    def discard(self, pos):
+        self.lightMaps.pop(pos, None)
+        self._bottomLight.pop(pos, None)
+
+    def _topLight(self, cx, cy):
+        """从上方照进区块(cx, cy)的光"""
+        try:
+            return self._bottomLight[(cx, cy + 1)]
+        except KeyError:
+            # 上方区块没有加载时，地形最高处以上当作露天，以下当作不见天日
+            if (cy + 1) * CHUNK_SIZE >= SKYLIGHT_OPEN_HEIGHT:
+                return np.full(CHUNK_SIZE, MAX_LIGHT, dtype=np.int16)
+            return np.zeros(CHUNK_SIZE, dtype=np.int16)
+
+    def _computeChunk(self, cx, cy):
+        """重算一个区块的光照，返回(光照是否变化, 透下去的光是否变化)"""
+        opacity = _OPACITY[self.world.loadedChunks[(cx, cy)].blocks]
+        # 每个方块上方（不含自己）到区块顶部为止吸收的光，最上面的实心方块本身是亮的
+        absorbed = np.cumsum(opacity[:, ::-1], axis=1)[:, ::-1]
+        top = self._topLight(cx, cy)
+        light = np.clip(top[:, None] - (absorbed - opacity), 0, MAX_LIGHT).astype(np.uint8)
+        bottom = np.clip(top - absorbed[:, 0], 0, MAX_LIGHT)
+
+        oldLight = self.lightMaps.get((cx, cy))
+        oldBottom = self._bottomLight.get((cx, cy))
+        self.lightMaps[(cx, cy)] = light
+        self._bottomLight[(cx, cy)] = bottom
+        return (oldLight is None or not np.array_equal(light, oldLight),
+                oldBottom is None or not np.array_equal(bottom, oldBottom))
+
+    def update(self, positions) -> set:
+        """这些区块刚加载或方块有变化，从它们开始往下重算光照，返回光照有变化的区块坐标"""
+        loaded = self.world.loadedChunks
+        changed = set()
+        done = set()
+        # 同一列里从上往下处理，下方的区块只需重算一次
+        for cx, cy in sorted(positions, key=lambda p: -p[1]):
+            if (cx, cy) in done:
+                continue
+            while (cx, cy) in loaded:
+                lightChanged, bottomChanged = self._computeChunk(cx, cy)
+                done.add((cx, cy))
+                if lightChanged:
+                    changed.add((cx, cy))
+                cy -= 1
+                if not bottomChanged and (cx, cy) in self.lightMaps:
+                    # 下面的区块照到的光没有变，不用再往下算了
+                    break
+        return changed
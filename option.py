@@ -5,8 +5,21 @@ MAX_FPS = 60
 CHUNK_SIZE = 16
 BLOCK_SIZE = 16  # 单位:px
 LOAD_RANGE = 5
+PREFETCH_LOOKAHEAD = 20  # 按当前速度预测多少帧之后的相机位置来预取区块
+PREFETCH_BUDGET = 2  # 每帧最多预取的区块数
+CHUNK_WORKERS = 2  # 生成区块的工作进程数，为0时在主进程里生成
+CHUNK_ARENA_SLOTS = 4 * (2 * LOAD_RANGE + 1) ** 2  # 共享内存能同时放多少个区块，加载、预取的区块都在里面
+STRUCTURE_REGION_SIZE = 64  # 结构放置区域的边长，单个结构不能比它大，单位:方块
+STRUCTURE_CACHE_SIZE = 256  # 最多缓存多少个区域的结构放置结果
 DEFAULT_SEED = 0
 LAYER_TIP_DISPLAY_TIME = 300
+SIM_TICK_RATE = 20  # 沙子、水模拟每秒的tick数
+SIM_MAX_TICKS_PER_FRAME = 4  # 卡顿时一帧最多补跑几个tick
+MAX_LIGHT = 15  # 天光的最大亮度
+SKYLIGHT_OPEN_HEIGHT = 32  # 地形最高不会超过这里，上方区块未加载时这以上当作露天，单位:方块
+MIN_BLOCK_BRIGHTNESS = 40  # 完全照不到天光的方块的亮度，0~255
+IMPORT_TIME_BUDGET = 150  # 核心模块的导入耗时预算(区块数据用到的numpy约占80ms)，单位:ms
+WORKER_START_BUDGET = 300  # 启动一个工作进程并导入核心模块的耗时预算，单位:ms
 
 
 class BlockID:
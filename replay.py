@@ -0,0 +1,155 @@
+import csv
+import json
+import time
+
+import pygame
+
+from option import *
+
+# 录制的按键，顺序即位掩码中的位序
+RECORD_KEYS = (
+    pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT,
+    pygame.K_SPACE, pygame.K_LSHIFT, pygame.K_MINUS, pygame.K_EQUALS
+)
+UP, DOWN, LEFT, RIGHT, SPACE, LSHIFT, MINUS, EQUALS = (1 << i for i in range(len(RECORD_KEYS)))
+
+
+class KeyState:
+    """用位掩码还原出的按键状态，可以像pygame.key.get_pressed()的返回值一样按键值取下标"""
+
+    __slots__ = ("mask",)
+
+    def __init__(self, mask=0):
+        self.mask = mask
+
+    def __getitem__(self, key):
+        try:
+            return bool(self.mask >> RECORD_KEYS.index(key) & 1)
+        except ValueError:
+            return False
+
+    @staticmethod
+    def encode(pressedKeys):
+        mask = 0
+        for i, key in enumerate(RECORD_KEYS):
+            if pressedKeys[key]:
+                mask |= 1 << i
+        return mask
+
+
+class InputRecord:
+    """按tick录制的按键状态序列，以及开始录制时相机的位置、速度和缩放倍率"""
+
+    def __init__(self, seed=DEFAULT_SEED, ticks=None, position=(0, 0), velocity=(0, 0), scale=1.0):
+        self.seed = seed
+        self.ticks = [] if ticks is None else ticks
+        self.position = tuple(position)
+        self.velocity = tuple(velocity)
+        self.scale = scale
+
+    def __repr__(self):
+        return f"InputRecord(seed={self.seed}, ticks={len(self.ticks)})"
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __iter__(self):
+        return (KeyState(mask) for mask in self.ticks)
+
+    def push(self, pressedKeys):
+        self.ticks.append(KeyState.encode(pressedKeys))
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump({"seed": self.seed, "position": self.position, "velocity": self.velocity,
+                       "scale": self.scale, "ticks": self.ticks}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        # 旧的录制没有相机状态，当作从原点开始
+        return cls(seed=data["seed"], ticks=data["ticks"], position=data.get("position", (0, 0)),
+                   velocity=data.get("velocity", (0, 0)), scale=data.get("scale", 1.0))
+
+    @classmethod
+    def fromSegments(cls, segments, seed=DEFAULT_SEED):
+        """由(按键掩码, 持续tick数)组成的片段生成录制"""
+        ticks = []
+        for mask, count in segments:
+            ticks.extend([mask] * count)
+        return cls(seed=seed, ticks=ticks)
+
+
+# 标准相机路径场景，用来在不同版本之间对比性能
+SCENARIOS = {
+    # 静止不动，作为基准
+    "idle": ((0, 300),),
+    # 沿地表快速平移
+    "pan_surface": ((RIGHT, 600),),
+    # 向上穿过地表与天域的分界线，再飞回来
+    "cross_layers": ((UP, 300), (0, 30), (DOWN, 300)),
+    # 在地表缩到最小后平移
+    "zoom_out_surface": ((MINUS, 20), (RIGHT, 400), (LEFT, 400)),
+}
+
+
+def getScenario(name, seed=DEFAULT_SEED):
+    return InputRecord.fromSegments(SCENARIOS[name], seed=seed)
+
+
+class ReplayReport:
+    """回放时每一帧的耗时和区块生成、加载、卸载数量"""
+
+    FIELDS = ("frame", "ms", "generated", "loaded", "dumped")
+
+    def __init__(self, name=""):
+        self.name = name
+        self.frames = []
+
+    def __len__(self):
+        return len(self.frames)
+
+    def push(self, ms, generated, loaded, dumped):
+        self.frames.append((len(self.frames), ms, generated, loaded, dumped))
+
+    def summary(self):
+        if not self.frames:
+            return {}
+        times = sorted(f[1] for f in self.frames)
+        return {
+            "frames": len(times),
+            "total_ms": sum(times),
+            "mean_ms": sum(times) / len(times),
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+            "max_ms": times[-1],
+            "generated": sum(f[2] for f in self.frames),
+            "loaded": sum(f[3] for f in self.frames),
+            "dumped": sum(f[4] for f in self.frames),
+        }
+
+    def dump(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.FIELDS)
+            for frame in self.frames:
+                writer.writerow((frame[0], round(frame[1], 3), *frame[2:]))
+
+    @classmethod
+    def load(cls, path):
+        report = cls(path)
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                report.frames.append((int(row[0]), float(row[1]), *map(int, row[2:])))
+        return report
+
+    def compare(self, baseline):
+        """与基准报告对比，返回每一项的(基准值, 当前值)"""
+        old, new = baseline.summary(), self.summary()
+        return {k: (old.get(k), v) for k, v in new.items()}
+
+
+def defaultRecordPath():
+    return f"./records/record_{time.strftime('%Y%m%d_%H%M%S')}.json"
@@ -0,0 +1,151 @@
+import time
+
+import numpy as np
+
+from option import *
+
+AIR, SAND, WATER = BlockID.air, BlockID.sand, BlockID.water
+# 未加载的邻居当作实心方块，什么都流不进去
+_SOLID = BlockID.stone
+# 处理一个区块时，横向拼上左右各几个区块，纵向拼上上下各一个区块
+_SPAN = 2
+# 水沿水平方向最远能找多远的落差，不能超出拼起来的范围
+_FLOW_REACH = _SPAN * CHUNK_SIZE
+_NEIGHBOURS = tuple((dx, dy) for dy in (-1, 0, 1) for dx in range(-_SPAN, _SPAN + 1))
+
+
+def _view(grid, dx, dy):
+    """拼成的数组里，中间区块整体偏移(dx, dy)后的视图"""
+    x0, y0 = _SPAN * CHUNK_SIZE + dx, CHUNK_SIZE + dy
+    return grid[x0:x0 + CHUNK_SIZE, y0:y0 + CHUNK_SIZE]
+
+
+class Simulation:
+    """
+    沙子下落和水流动的元胞自动机
+    只模拟活跃区块，区块内用numpy掩码一次处理所有会动的格子。一个区块在某个tick里没有任何变化就进入休眠，
+    休眠的区块不花任何时间，直到它或它的邻居被修改、加载时才被唤醒。
+    以固定的tick速率运行，与帧率无关。
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.activeChunks = set()
+        self.tickCount = 0
+        self._accumulator = 0.0
+
+        # 性能统计，显示在调试界面里
+        self.tickCost = 0.0  # 最近一个tick的耗时，单位:ms
+        self.lastActiveCount = 0  # 最近一个tick处理的区块数
+
+        world.addChunkListener(self.wake)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(tick={self.tickCount}, active={len(self.activeChunks)})"
+
+    def wake(self, positions):
+        """唤醒这些区块和处理时会拼在一起的邻居，下一个tick会检查它们"""
+        for cx, cy in positions:
+            for dx, dy in _NEIGHBOURS:
+                self.activeChunks.add((cx + dx, cy + dy))
+
+    def advance(self, dt):
+        """经过dt秒，按SIM_TICK_RATE运行相应次数的tick，返回运行的次数"""
+        self._accumulator = min(self._accumulator + dt, SIM_MAX_TICKS_PER_FRAME / SIM_TICK_RATE)
+        ticks = 0
+        while self._accumulator >= 1 / SIM_TICK_RATE:
+            self._accumulator -= 1 / SIM_TICK_RATE
+            self.tick()
+            ticks += 1
+        return ticks
+
+    def tick(self):
+        t = time.perf_counter()
+        # 横向移动的方向每个tick交替一次
+        d = 1 if self.tickCount % 2 == 0 else -1
+        loaded = self.world.loadedChunks
+        # 从下往上、逆着横向移动的方向处理，移进已处理区块的格子不会在同一个tick里再动一次
+        active = sorted((p for p in self.activeChunks if p in loaded), key=lambda p: (p[1], -d * p[0]))
+        self.activeChunks = set()
+
+        changed = set()
+        for pos in active:
+            changed |= self._stepChunk(pos, d)
+        self.tickCount += 1
+        self.lastActiveCount = len(active)
+
+        if changed:
+            for pos in changed:
+                loaded[pos].dirty = True
+            # 通知渲染等缓存，同时经由wake唤醒变化了的区块和它们的邻居
+            self.world.onChunksChanged(changed)
+        self.tickCost = (time.perf_counter() - t) * 1000
+
+    def _stepChunk(self, pos, d) -> set:
+        """让区块里的沙子和水走一步，可能会移进相邻区块，返回发生变化的区块坐标"""
+        loaded = self.world.loadedChunks
+        blocks = loaded[pos].blocks
+        if not ((blocks == SAND) | (blocks == WATER)).any():
+            return set()
+
+        # 与周围的区块拼在一起，移进邻居区块的格子可以和区块内一样整体处理
+        cx, cy = pos
+        grid = np.full(((2 * _SPAN + 1) * CHUNK_SIZE, 3 * CHUNK_SIZE), _SOLID, dtype=np.int8)
+        for dx, dy in _NEIGHBOURS:
+            chunk = loaded.get((cx + dx, cy + dy))
+            if chunk is not None:
+                _view(grid, dx * CHUNK_SIZE, dy * CHUNK_SIZE)[...] = chunk.blocks
+        old = grid.copy()
+        moved = np.zeros(grid.shape, dtype=bool)
+
+        # 以下都是区块内格子（源）以及它下方、侧方、侧下方格子（目标）的视图
+        center, movedCenter = _view(grid, 0, 0), _view(moved, 0, 0)
+        below, movedBelow = _view(grid, 0, -1), _view(moved, 0, -1)
+        side = _view(grid, d, 0)
+        sideBelow, movedSideBelow = _view(grid, d, -1), _view(moved, d, -1)
+
+        # 每一步里一个目标格子只可能来自一个源格子，所以可以整体赋值
+        # 1. 下方是空气就往下落
+        m = ((center == SAND) | (center == WATER)) & (below == AIR)
+        below[m] = center[m]
+        center[m] = AIR
+        movedBelow |= m
+
+        # 2. 沙子沉到水里，和水交换位置
+        m = (center == SAND) & (below == WATER) & ~movedCenter
+        below[m] = SAND
+        center[m] = WATER
+        movedBelow |= m
+        movedCenter |= m
+
+        # 3. 落不下去的沙子往侧下方滑
+        m = (center == SAND) & ~movedCenter & (below != AIR) & (side == AIR) & (sideBelow == AIR)
+        sideBelow[m] = SAND
+        center[m] = AIR
+        movedSideBelow |= m
+
+        # 4. 落不下去的水沿水平方向找_FLOW_REACH格内最近的落差，路上都是空气就直接移到落差上方，
+        #    下个tick再落下去。每次横移后必然下落，所以水一定会静止，不会来回抖动。
+        #    静止时_FLOW_REACH格以内的水面高低最多差一格，更宽的水面上可能留下每_FLOW_REACH格一级的台阶
+        clear = (center == WATER) & ~movedCenter & (below != AIR)
+        for step in range(d, d * (_FLOW_REACH + 1), d):
+            target = _view(grid, step, 0)
+            clear &= target == AIR
+            if not clear.any():
+                break
+            m = clear & (_view(grid, step, -1) == AIR)
+            if m.any():
+                target[m] = WATER
+                center[m] = AIR
+                _view(moved, step, 0)[m] = True
+                clear &= ~m
+
+        # 写回有变化的区块
+        diff = grid != old
+        changed = set()
+        for dx, dy in _NEIGHBOURS:
+            if not _view(diff, dx * CHUNK_SIZE, dy * CHUNK_SIZE).any():
+                continue
+            loaded[(cx + dx, cy + dy)].blocks[...] = _view(grid, dx * CHUNK_SIZE, dy * CHUNK_SIZE)
+            changed.add((cx + dx, cy + dy))
+        return changed
@@ -0,0 +1,126 @@
+import random
+from collections import OrderedDict
+
+import numpy as np
+
+from option import *
+
+# 结构模板中表示“保留原有方块”的值
+KEEP = -1
+
+
+class Structure:
+    """
+    结构模板
+    blocks[i][j]是相对锚点（结构左下角）第i列、第j行的方块，KEEP表示不覆盖原有方块
+    """
+
+    def __init__(self, name, blocks, anchorYRange, chance):
+        self.name = name
+        self.blocks = blocks
+        self.width, self.height = blocks.shape
+        self.anchorYRange = anchorYRange  # 锚点y坐标的取值范围，左闭右开
+        self.chance = chance  # 每个区域里生成的概率
+
+    def __repr__(self):
+        return f"Structure({self.name}, {self.width}x{self.height})"
+
+
+def _ellipse(width, height):
+    """返回宽width、高height的椭圆内部的掩码"""
+    dx = (np.arange(width) - (width - 1) / 2) / (width / 2)
+    dy = (np.arange(height) - (height - 1) / 2) / (height / 2)
+    return dx[:, None] ** 2 + dy[None, :] ** 2 <= 1
+
+
+def _waterCave():
+    # 地下深处的水窟：椭圆形空腔，下半部分积着水，水下的底和壁是沙子
+    # 上半部分的顶和壁用石头，沙子悬空会塌下来
+    outer = _ellipse(24, 12)
+    inner = np.zeros_like(outer)
+    inner[1:-1, 1:-1] = _ellipse(22, 10)
+    blocks = np.full(outer.shape, KEEP, dtype=np.int8)
+    blocks[outer] = BlockID.stone
+    blocks[:, :6][outer[:, :6]] = BlockID.sand
+    blocks[inner] = BlockID.air
+    blocks[:, :6][inner[:, :6]] = BlockID.water
+    return blocks
+
+
+def _cloudCluster():
+    # 天域上空的大云团，比区块还宽
+    mask = _ellipse(48, 14)
+    blocks = np.full(mask.shape, KEEP, dtype=np.int8)
+    blocks[mask] = BlockID.cloud
+    return blocks
+
+
+STRUCTURES = (
+    Structure("水窟", _waterCave(), (-185, -40), 0.5),
+    Structure("云团", _cloudCluster(), (460, 760), 0.6),
+)
+
+
+class StructureIndex:
+    """
+    结构放置索引
+    按STRUCTURE_REGION_SIZE把世界划成区域，每个区域的结构锚点只由种子和区域坐标决定，
+    算过的区域缓存在有上限的LRU里。生成区块时只需查它附近的几个区域，把与它相交的结构印上去，
+    相邻区块不必各自重复计算同一个结构放在哪。
+    """
+
+    def __init__(self, seed, structures=STRUCTURES, cacheSize=STRUCTURE_CACHE_SIZE):
+        self.seed = seed
+        self.structures = structures
+        self.cacheSize = cacheSize
+        self._cache = OrderedDict()
+        # 结构的尺寸不超过区域，所以一个区块最多只会被左下方相邻的区域里的结构覆盖到
+        for s in structures:
+            if s.width > STRUCTURE_REGION_SIZE or s.height > STRUCTURE_REGION_SIZE:
+                raise ValueError(f"{s} is larger than a structure region.")
+        self._reach = max((max(s.width, s.height) for s in structures), default=0)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(seed={self.seed}, cached={len(self._cache)})"
+
+    def getRegion(self, rx, ry) -> tuple:
+        """返回区域(rx, ry)里的所有结构，每项为(结构, 锚点x, 锚点y)"""
+        try:
+            self._cache.move_to_end((rx, ry))
+            return self._cache[(rx, ry)]
+        except KeyError:
+            pass
+
+        placements = []
+        x0, y0 = rx * STRUCTURE_REGION_SIZE, ry * STRUCTURE_REGION_SIZE
+        rng = random.Random(hash((self.seed, rx, ry)))
+        for s in self.structures:
+            # 每种结构固定消耗同样多的随机数，保证区域里其他结构的位置不受影响
+            roll, u, v = rng.random(), rng.random(), rng.random()
+            yMin = max(s.anchorYRange[0], y0)
+            yMax = min(s.anchorYRange[1], y0 + STRUCTURE_REGION_SIZE)
+            if yMin >= yMax or roll >= s.chance:
+                continue
+            placements.append((s, x0 + int(u * STRUCTURE_REGION_SIZE), yMin + int(v * (yMax - yMin))))
+
+        placements = self._cache[(rx, ry)] = tuple(placements)
+        if len(self._cache) > self.cacheSize:
+            self._cache.popitem(last=False)
+        return placements
+
+    def stampChunk(self, chunk):
+        """把与区块相交的结构印到区块上，开销与结构大小无关"""
+        x0, y0 = chunk.x * CHUNK_SIZE, chunk.y * CHUNK_SIZE
+        blocks = chunk.blocks
+        for ry in range((y0 - self._reach) // STRUCTURE_REGION_SIZE, (y0 + CHUNK_SIZE) // STRUCTURE_REGION_SIZE + 1):
+            for rx in range((x0 - self._reach) // STRUCTURE_REGION_SIZE,
+                            (x0 + CHUNK_SIZE) // STRUCTURE_REGION_SIZE + 1):
+                for s, ax, ay in self.getRegion(rx, ry):
+                    # 结构与区块相交部分在区块内的范围
+                    i0, i1 = max(ax - x0, 0), min(ax + s.width - x0, CHUNK_SIZE)
+                    j0, j1 = max(ay - y0, 0), min(ay + s.height - y0, CHUNK_SIZE)
+                    if i0 >= i1 or j0 >= j1:
+                        continue
+                    src = s.blocks[x0 + i0 - ax:x0 + i1 - ax, y0 + j0 - ay:y0 + j1 - ay]
+                    mask = src != KEEP
+                    blocks[i0:i1, j0:j1][mask] = src[mask]
@@ -1,7 +1,8 @@
-
+import random
 
 from option import *
-from base2 import *
+from base2 import NoiseSet, PerlinNoise2D, ValueNoise1D
+from structure import StructureIndex
 
 
 WORLD_LAYER_EDGE = [-200, 320, 800, 1200]
@@ -49,24 +50,29 @@ class WorldGenerator:
             ValueNoise1D(seed=seed + 1212, frequency=12, loud=5)
         )
 
+        self.structureIndex = StructureIndex(seed)
+
     def generateChunk(self, chunk):
-        for line in chunk.blocks:
-            y = line[0].y
-            if -200 <= y < 320:
-                wga = self._ground
-            elif 320 <= y < 800:
-                wga = self._skyLand
-            else:
-                wga = self._none
-            for block in line:
-                wga(block)
-
-    def _none(self, block):
-        pass
-
-    def _ground(self, block):
+        y0 = chunk.y * CHUNK_SIZE
+        if -200 <= y0 < 320:
+            wga = self._ground
+        elif 320 <= y0 < 800:
+            wga = self._skyLand
+        else:
+            # 这里没有地形，区块保持填充时的空气
+            wga = None
+        if wga is not None:
+            blocks = chunk.blocks
+            for i in range(CHUNK_SIZE):
+                x = chunk.x * CHUNK_SIZE + i
+                for j in range(CHUNK_SIZE):
+                    blocks[i, j] = wga(x, y0 + j)
+
+        # 地形生成完再印上与这个区块相交的结构
+        self.structureIndex.stampChunk(chunk)
+
+    def _ground(self, x, y):
         # 地表地形
-        x, y = block.x, block.y
         random.seed(x)
         density = self.worldGenCurve(self._groundNS(x, y), y)
         bT = BlockID.air
@@ -78,16 +84,15 @@ class WorldGenerator:
         elif 50 <= density:
             bT = BlockID.stone
 
-        block.blockType = bT
+        return bT
 
-    def _skyLand(self, block):
-        x, y = block.x, block.y
+    def _skyLand(self, x, y):
         bottom = round(self._skyLandBottomNS(x) + 340)
         top = round(self._skyLandTopNS(x) + 370)
         bT = BlockID.air
         if bottom <= y < top:
             bT = BlockID.cloud
-        block.blockType = bT
+        return bT
 
     def worldGenCurve(self, nv, y):
         """定义域Z 值域R"""
@@ -97,6 +102,8 @@ class WorldGenerator:
 if __name__ == "__main__":
     import pygame
 
+    from base2 import Vector2D
+
     cameraX = 0
     cameraY = 0
 